@@ -6,6 +6,11 @@ import re
 import srt
 import subprocess
 import os
+import hashlib
+import mmap
+import struct
+import tempfile
+from array import array
 
 # ------------------------------------------------- 
 # 1. 文件读写与解析
@@ -30,11 +35,6 @@ def read_txt_lines(path):
     content = read_file(path)
     return [line.strip() for line in content.splitlines() if line.strip()]
 
-def parse_srt_file(path):
-    """解析 SRT 文件并返回字幕对象列表"""
-    srt_content = read_file(path)
-    return list(srt.parse(srt_content))
-
 # ------------------------------------------------- 
 # 2. 文本处理与字幕匹配
 # ------------------------------------------------- 
@@ -43,24 +43,6 @@ def normalize_text(text):
     """规范化文本中的空白字符"""
     return re.sub(r'\s+', ' ', text.strip())
 
-def extract_srt_texts(subtitles):
-    """提取并规范化 SRT 字幕文本"""
-    return [normalize_text(sub.content) for sub in subtitles]
-
-def find_txt_indices_in_srt(txt_lines, srt_texts):
-    """查找 TXT 行在 SRT 字幕中的索引（只记录第一个匹配）"""
-    indices = []
-    found_indices = set()
-    for txt_line in txt_lines:
-        txt_line_norm = normalize_text(txt_line)
-        for idx, srt_text in enumerate(srt_texts):
-            # 确保每个 SRT 字幕只被匹配一次
-            if txt_line_norm == srt_text and idx not in found_indices:
-                indices.append(str(idx + 1))  # SRT index starts from 1
-                found_indices.add(idx)
-                break
-    return indices
-
 def merge_indices(indices):
     """按原始顺序合并连续的字幕索引"""
     if not indices:
@@ -80,7 +62,254 @@ def merge_indices(indices):
     return merged
 
 # ------------------------------------------------- 
-# 3. FFmpeg 视频处理
+# 3. 列式字幕时间轴
+# ------------------------------------------------- 
+
+class SubtitleTimeline:
+    """紧凑的列式字幕时间轴
+
+    开始/结束时间以毫秒整数保存在数组中，规范化后的文本去重驻留，
+    每条字幕只保存文本编号和原始 SRT 序号。位置从 1 开始，与 merge_indices 的结果一致。
+    """
+
+    _MAGIC = b'SRTL'
+    _VERSION = 2
+    # 魔数, 版本, 字节序标记, 保留, 字幕条数, 文本条数, 文本字节数,
+    # 源文件大小, 源文件 mtime_ns, 源文件 SHA-256
+    _HEADER = struct.Struct('<4sHBxqqqqq32s')
+    _HEADER_SIZE = _HEADER.size
+
+    def __init__(self, starts_ms, ends_ms, text_ids, orig_indices, texts, source=None, _mmap=None):
+        self.starts_ms = starts_ms
+        self.ends_ms = ends_ms
+        self.text_ids = text_ids
+        self.orig_indices = orig_indices
+        self.texts = texts
+        # 源 SRT 文件签名 (大小, mtime_ns, SHA-256)，用于判断缓存是否仍然有效
+        self.source = source
+        self._mmap = _mmap
+
+    @classmethod
+    def from_subtitles(cls, subtitles, source=None):
+        """从字幕对象序列一次遍历构建时间轴（可直接传入 srt.parse 的生成器）"""
+        starts_ms, ends_ms = array('q'), array('q')
+        text_ids, orig_indices = array('q'), array('q')
+        texts = []
+        text_to_id = {}
+        for sub in subtitles:
+            text = normalize_text(sub.content)
+            text_id = text_to_id.get(text)
+            if text_id is None:
+                text_id = text_to_id[text] = len(texts)
+                texts.append(sys.intern(text))
+            starts_ms.append(_timedelta_to_ms(sub.start))
+            ends_ms.append(_timedelta_to_ms(sub.end))
+            text_ids.append(text_id)
+            orig_indices.append(sub.index if sub.index is not None else len(orig_indices) + 1)
+        return cls(starts_ms, ends_ms, text_ids, orig_indices, texts, source)
+
+    def __len__(self):
+        return len(self.starts_ms)
+
+    def text(self, position):
+        """返回第 position 条字幕（从 1 开始）的规范化文本"""
+        return self.texts[self.text_ids[position - 1]]
+
+    def start_seconds(self, position):
+        """返回第 position 条字幕（从 1 开始）的开始时间（秒）"""
+        return self.starts_ms[position - 1] / 1000
+
+    def end_seconds(self, position):
+        """返回第 position 条字幕（从 1 开始）的结束时间（秒）"""
+        return self.ends_ms[position - 1] / 1000
+
+    def group_span(self, group):
+        """返回连续字幕段落的 (开始秒, 结束秒)"""
+        return self.start_seconds(group[0]), self.end_seconds(group[-1])
+
+    def find_txt_indices(self, txt_lines):
+        """查找 TXT 行在时间轴中的位置（从 1 开始，只记录第一个匹配）"""
+        positions_by_text = {}
+        for pos, text_id in enumerate(self.text_ids, 1):
+            positions_by_text.setdefault(text_id, []).append(pos)
+        text_to_id = {text: text_id for text_id, text in enumerate(self.texts)}
+
+        indices = []
+        # 每个文本下一个可用位置的游标，确保每个 SRT 字幕只被匹配一次
+        cursors = {}
+        for txt_line in txt_lines:
+            text_id = text_to_id.get(normalize_text(txt_line))
+            if text_id is None:
+                continue
+            positions = positions_by_text[text_id]
+            cursor = cursors.get(text_id, 0)
+            if cursor < len(positions):
+                indices.append(str(positions[cursor]))
+                cursors[text_id] = cursor + 1
+        return indices
+
+    # ---------- 保存与内存映射加载 ----------
+
+    def save(self, path):
+        """将时间轴保存为二进制文件，供 load 以内存映射方式读取
+
+        先写入同目录下的临时文件再用 os.replace 替换，已内存映射的旧文件不受影响，
+        写入中断也不会留下不完整的文件。
+        """
+        encoded = [text.encode('utf-8') for text in self.texts]
+        offsets = array('q', [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        src_size, src_mtime_ns, src_hash = self.source or (-1, -1, b'')
+        header = self._HEADER.pack(
+            self._MAGIC, self._VERSION, 1 if sys.byteorder == 'little' else 0,
+            len(self), len(self.texts), offsets[-1],
+            src_size, src_mtime_ns, src_hash,
+        )
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                for column in (self.starts_ms, self.ends_ms, self.text_ids, self.orig_indices):
+                    f.write(column)
+                f.write(offsets)
+                f.write(b''.join(encoded))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise IOError(f"保存时间轴文件 '{path}' 时出错: {e}")
+
+    @classmethod
+    def load(cls, path):
+        """以内存映射方式加载 save 生成的时间轴文件，数值列不复制到内存
+
+        返回的时间轴持有打开的内存映射，用完后须调用 close() 或使用 with 语句。
+        """
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < cls._HEADER_SIZE:
+                    raise ValueError(f"时间轴文件 '{path}' 无效: 文件过短")
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"错误: 文件 '{path}' 未找到。")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise IOError(f"读取时间轴文件 '{path}' 时出错: {e}")
+
+        view = None
+        columns = []
+        try:
+            (magic, version, little, count, n_texts, blob_size,
+             src_size, src_mtime_ns, src_hash) = cls._HEADER.unpack_from(mm, 0)
+            if magic != cls._MAGIC or version != cls._VERSION:
+                raise ValueError("不是受支持的时间轴文件")
+            if bool(little) != (sys.byteorder == 'little'):
+                raise ValueError("文件字节序与当前平台不一致")
+            if count < 0 or n_texts < 0 or blob_size < 0:
+                raise ValueError("头部信息无效")
+            expected = cls._HEADER_SIZE + 8 * (4 * count + n_texts + 1) + blob_size
+            if len(mm) != expected:
+                raise ValueError("文件长度与头部信息不符")
+
+            view = memoryview(mm)
+            pos = cls._HEADER_SIZE
+            for size in (count, count, count, count, n_texts + 1):
+                columns.append(view[pos:pos + 8 * size].cast('q'))
+                pos += 8 * size
+            offsets = columns[-1]
+            if offsets[0] != 0 or offsets[-1] != blob_size \
+                    or any(a > b for a, b in zip(offsets, offsets[1:])):
+                raise ValueError("文本偏移表无效")
+            text_ids = columns[2]
+            if count and (min(text_ids) < 0 or max(text_ids) >= n_texts):
+                raise ValueError("文本编号越界")
+            blob = bytes(view[pos:pos + blob_size])
+            texts = [sys.intern(blob[offsets[i]:offsets[i + 1]].decode('utf-8')) for i in range(n_texts)]
+            columns.pop().release()
+        except Exception as e:
+            for column in columns:
+                column.release()
+            if view is not None:
+                view.release()
+            mm.close()
+            raise ValueError(f"时间轴文件 '{path}' 无效: {e}")
+        view.release()
+        source = (src_size, src_mtime_ns, src_hash) if src_size >= 0 else None
+        return cls(*columns, texts, source, _mmap=mm)
+
+    def close(self):
+        """释放内存映射（仅对 load 得到的时间轴有效）"""
+        if self._mmap is None:
+            return
+        for column in (self.starts_ms, self.ends_ms, self.text_ids, self.orig_indices):
+            column.release()
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _timedelta_to_ms(delta):
+    """将 timedelta 转换为整数毫秒"""
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+def _read_srt_source(path):
+    """读取 SRT 文件，返回 (文本内容, 源文件签名)"""
+    try:
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        content = data.decode('utf-8')
+    except FileNotFoundError:
+        raise FileNotFoundError(f"错误: 文件 '{path}' 未找到。")
+    except Exception as e:
+        raise IOError(f"读取文件 '{path}' 时出错: {e}")
+    return content, (st.st_size, st.st_mtime_ns, hashlib.sha256(data).digest())
+
+def timeline_cache_path(srt_path):
+    """返回 SRT 文件对应的时间轴缓存路径（位于系统临时目录），无法创建缓存目录时返回 None"""
+    cache_dir = os.path.join(tempfile.gettempdir(), 'reOrder_timeline_cache')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None
+    key = hashlib.sha256(os.path.abspath(srt_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}.timeline")
+
+def load_srt_timeline(path, cache_path=None):
+    """解析 SRT 文件并一次遍历构建 SubtitleTimeline
+
+    指定 cache_path 时，若缓存记录的源文件大小、mtime 和 SHA-256 与当前 SRT 文件完全一致，
+    则直接内存映射加载；否则重新解析并尽量写入缓存，缓存写入失败不影响返回结果。
+    从缓存加载的时间轴持有打开的内存映射，调用方须调用 close() 或使用 with 语句释放；
+    对直接解析得到的时间轴调用 close() 没有副作用。
+    """
+    content, source = _read_srt_source(path)
+    if cache_path and os.path.exists(cache_path):
+        try:
+            cached = SubtitleTimeline.load(cache_path)
+        except (ValueError, OSError):
+            cached = None  # 缓存损坏、为空或无法读取，重新解析
+        if cached is not None:
+            if cached.source == source:
+                return cached
+            cached.close()  # 缓存来自其他版本的 SRT 文件
+    timeline = SubtitleTimeline.from_subtitles(srt.parse(content), source)
+    if cache_path:
+        try:
+            timeline.save(cache_path)
+        except (IOError, OSError):
+            pass  # 缓存仅用于加速，写入失败时直接使用解析结果
+    return timeline
+
+# ------------------------------------------------- 
+# 4. FFmpeg 视频处理
 # ------------------------------------------------- 
 
 def get_bitrate(video_file):
@@ -97,16 +326,15 @@ def get_bitrate(video_file):
         return "2000k" # 返回一个安全的默认值
     return result.stdout.strip()
 
-def cut_video(subtitles, merged_groups, video_file, log_callback=print):
-    """根据合并后的索引组剪辑视频"""
+def cut_video(timeline, merged_groups, video_file, log_callback=print):
+    """根据合并后的索引组和 SubtitleTimeline 剪辑视频"""
     temp_clips = []
     try:
         bit_rate = get_bitrate(video_file)
         log_callback(f"获取到视频比特率: {bit_rate}")
 
         for i, group in enumerate(merged_groups, 1):
-            start = subtitles[group[0]-1].start.total_seconds()
-            end = subtitles[group[-1]-1].end.total_seconds()
+            start, end = timeline.group_span(group)
             output = f"temp_clip_{i}.mp4"
             temp_clips.append(output)
 
@@ -149,21 +377,21 @@ def concat_videos(clips, output_file, log_callback=print):
         log_callback("已清理所有临时片段文件。")
 
 # ------------------------------------------------- 
-# 4. 后台处理线程
+# 5. 后台处理线程
 # ------------------------------------------------- 
 
 def processing_logic_thread(srt_path, txt_path, video_path, output_path, log_queue):
     """在后台线程中运行的完整处理逻辑"""
+    timeline = None
     try:
         log_queue.put(">>> 任务开始：正在解析文件...")
-        subtitles = parse_srt_file(srt_path)
+        timeline = load_srt_timeline(srt_path, timeline_cache_path(srt_path))
         txt_lines = read_txt_lines(txt_path)
-        srt_texts = extract_srt_texts(subtitles)
-        log_queue.put(f"SRT 文件加载了 {len(subtitles)} 条字幕。")
+        log_queue.put(f"SRT 文件加载了 {len(timeline)} 条字幕。")
         log_queue.put(f"TXT 文件加载了 {len(txt_lines)} 行文本。")
 
         log_queue.put("\n>>> 正在匹配字幕索引...")
-        indices = find_txt_indices_in_srt(txt_lines, srt_texts)
+        indices = timeline.find_txt_indices(txt_lines)
         if not indices:
             raise ValueError("在 SRT 文件中没有匹配到任何 TXT 文本行，请检查文件内容。")
         log_queue.put(f"原始匹配到的字幕序号: {', '.join(indices)}")
@@ -172,7 +400,7 @@ def processing_logic_thread(srt_path, txt_path, video_path, output_path, log_que
         log_queue.put(f"合并后的连续字幕段落: {merged_groups}")
 
         log_queue.put("\n>>> 正在剪辑视频片段...")
-        temp_clips = cut_video(subtitles, merged_groups, video_path, log_callback=log_queue.put)
+        temp_clips = cut_video(timeline, merged_groups, video_path, log_callback=log_queue.put)
 
         log_queue.put("\n>>> 正在合并所有片段...")
         concat_videos(temp_clips, output_path, log_callback=log_queue.put)
@@ -180,4 +408,6 @@ def processing_logic_thread(srt_path, txt_path, video_path, output_path, log_que
     except Exception as e:
         log_queue.put(f"\n!!!!!! 处理出错 !!!!!!\n错误详情: {e}")
     finally:
+        if timeline is not None:
+            timeline.close()
         log_queue.put("<<DONE>>") # 发送完成信号